@@ -11,6 +11,7 @@ import json
 
 from imglookup.saucenao_api import get_post_ids
 from imglookup.e621_api import get_tags
+from imglookup.media import get_media_exts
 from imglookup.utils import (init_logger,
                              verbose,
                              get_recursive_images,
@@ -24,7 +25,7 @@ def main(args):
     # Check if path is a directory, if so, recurse into it
     paths = [args.path]
     if args.path and isdir(args.path):
-        paths = get_recursive_images(args.path)
+        paths = get_recursive_images(args.path, get_media_exts())
     # If path is missing, we must be debugging
     elif not args.path:
         paths = None
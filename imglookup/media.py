@@ -0,0 +1,260 @@
+from heapq import heappush, heappushpop
+from shutil import which
+from subprocess import run, Popen, PIPE, DEVNULL
+from typing import Iterator
+import json
+
+from PIL import Image, ImageChops, ImageStat, features
+
+from .utils import (verb,
+                    warn,
+                    err)
+
+try:
+    # Registers the AVIF decoder on Pillow builds without native support
+    import pillow_avif  # noqa: F401
+    has_avif_plugin = True
+except ImportError:
+    has_avif_plugin = False
+
+
+IMAGE_EXTS = ('jpg', 'jpeg', 'png', 'apng', 'gif', 'webp', 'avif')
+VIDEO_EXTS = ('mp4', 'webm')
+
+# Largest edge of a frame sent to the search API
+THUMBNAIL_SIZE = 512
+# Edge of the grayscale signature used for frame differencing
+SIGNATURE_SIZE = 32
+# Mean absolute difference (0.0-1.0) between signatures counted as a cut
+SCENE_THRESHOLD = 0.12
+# Upper bound on frames decoded per animated image, or sampled per video
+MAX_SCAN_FRAMES = 120
+# Frames per second sampled from videos while looking for cuts
+VIDEO_SCAN_FPS = 2
+# Frames returned as lookup candidates, including the first frame. Each
+# one may cost an API query, so only the strongest scene change is kept as
+# a fallback for when the first frame has no confident match
+MAX_KEYFRAMES = 2
+
+
+class MediaError(Exception):
+    """For media that cannot be probed or decoded"""
+    pass
+
+
+class MediaInfo:
+    """Header level information about an image or video"""
+
+    def __init__(self,
+                 path: str,
+                 width: int,
+                 height: int,
+                 animated: bool,
+                 video: bool):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.animated = animated
+        self.video = video
+
+
+def has_avif_support() -> bool:
+    """Returns True if Pillow can decode AVIF images"""
+    if has_avif_plugin:
+        return True
+    try:
+        return features.check_module('avif')
+    except ValueError:
+        # Pillow older than 11.2 has no native AVIF module
+        return False
+
+
+def get_media_exts() -> tuple[str, ...]:
+    """Returns the extensions that can be read with the installed tools"""
+    exts = [ext for ext in IMAGE_EXTS if ext != 'avif']
+    if has_avif_support():
+        exts.append('avif')
+    else:
+        warn("No AVIF support in Pillow, skipping .avif files")
+    if which('ffprobe') and which('ffmpeg'):
+        exts.extend(VIDEO_EXTS)
+    else:
+        warn("ffprobe/ffmpeg not found, skipping video files")
+
+    return tuple(exts)
+
+
+def get_ext(path: str) -> str:
+    """Returns the lower-cased file extension"""
+    return path.split('.')[-1].lower()
+
+
+def probe_media(path: str) -> MediaInfo:
+    """Reads the headers of `path` without decoding any pixel data"""
+    ext = get_ext(path)
+    if ext in VIDEO_EXTS:
+        return probe_video(path)
+    if ext not in IMAGE_EXTS:
+        err(f"Unsupported media type for {path}")
+
+    # Image.open only parses the header, pixel data is decoded on load()
+    with Image.open(path) as image:
+        width, height = image.size
+        return MediaInfo(path,
+                         width,
+                         height,
+                         getattr(image, 'is_animated', False),
+                         False)
+
+
+def probe_video(path: str) -> MediaInfo:
+    """Reads the first video stream headers with ffprobe"""
+    if which('ffprobe') is None:
+        err(f"ffprobe is required to read {path}")
+    result = run(['ffprobe', '-v', 'error',
+                  '-select_streams', 'v:0',
+                  '-show_entries',
+                  'stream=width,height:stream_tags=rotate'
+                  ':stream_side_data=rotation',
+                  '-of', 'json', path],
+                 stdout=PIPE, stderr=DEVNULL, check=True)
+    data = json.loads(result.stdout)
+    if not data.get('streams'):
+        err(f"No video stream found in {path}")
+    stream = data['streams'][0]
+    width, height = stream['width'], stream['height']
+    # ffmpeg autorotates on decode, so report the displayed dimensions
+    if get_rotation(stream) % 180 == 90:
+        width, height = height, width
+
+    return MediaInfo(path,
+                     width,
+                     height,
+                     True,
+                     True)
+
+
+def get_rotation(stream: dict) -> int:
+    """Returns the display rotation of an ffprobe stream in degrees"""
+    # Older files carry a `rotate` tag, newer ones a display matrix
+    rotation = int(stream.get('tags', {}).get('rotate', 0))
+    for side_data in stream.get('side_data_list', []):
+        if 'rotation' in side_data:
+            rotation = int(side_data['rotation'])
+
+    return rotation % 360
+
+
+def get_scaled_size(width: int, height: int) -> (int, int):
+    """Returns (WIDTH, HEIGHT) fitting within THUMBNAIL_SIZE"""
+    scale = min(1.0, THUMBNAIL_SIZE / max(width, height))
+    # Even dimensions keep ffmpeg's scaler happy for subsampled formats
+    return (max(2, round(width * scale / 2) * 2),
+            max(2, round(height * scale / 2) * 2))
+
+
+def load_still_image(info: MediaInfo) -> Image.Image:
+    """Decodes a single-frame image straight to thumbnail size"""
+    with Image.open(info.path) as image:
+        # Lets the JPEG decoder downscale while decoding
+        image.draft('RGB', (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        frame = image.convert('RGB')
+    frame.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+
+    return frame
+
+
+def iter_image_frames(info: MediaInfo) -> Iterator[Image.Image]:
+    """Yields downscaled RGB frames of a (possibly animated) image"""
+    with Image.open(info.path) as image:
+        # Seeking decodes every frame in between, and so does n_frames, so
+        # only the leading MAX_SCAN_FRAMES frames are ever decoded
+        for idx in range(MAX_SCAN_FRAMES):
+            try:
+                image.seek(idx)
+            except EOFError:
+                break
+            frame = image.convert('RGB')
+            frame.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            yield frame
+
+
+def iter_video_frames(info: MediaInfo) -> Iterator[Image.Image]:
+    """Yields downscaled RGB frames decoded by ffmpeg"""
+    if which('ffmpeg') is None:
+        err(f"ffmpeg is required to read {info.path}")
+    width, height = get_scaled_size(info.width, info.height)
+    frame_size = width * height * 3
+    # Let ffmpeg drop and scale frames so only small rgb24 buffers are piped
+    proc = Popen(['ffmpeg', '-v', 'error',
+                  '-i', info.path,
+                  '-vf', f'fps={VIDEO_SCAN_FPS},scale={width}:{height}',
+                  '-frames:v', str(MAX_SCAN_FRAMES),
+                  '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-'],
+                 stdout=PIPE, stderr=DEVNULL)
+    try:
+        while True:
+            buf = proc.stdout.read(frame_size)
+            if len(buf) < frame_size:
+                break
+            yield Image.frombytes('RGB', (width, height), buf)
+    finally:
+        proc.stdout.close()
+        proc.kill()
+        proc.wait()
+
+
+def get_signature(frame: Image.Image) -> Image.Image:
+    """Returns a tiny grayscale copy of `frame` for cheap comparisons"""
+    return frame.convert('L').resize((SIGNATURE_SIZE, SIGNATURE_SIZE),
+                                     Image.BILINEAR)
+
+
+def get_difference(a: Image.Image, b: Image.Image) -> float:
+    """Mean absolute difference of two signatures, from 0.0 to 1.0"""
+    return ImageStat.Stat(ImageChops.difference(a, b)).mean[0] / 255
+
+
+def sample_keyframes(path: str,
+                     max_frames: int = MAX_KEYFRAMES) -> Iterator[Image.Image]:
+    """Yields representative frames, best lookup candidate first
+
+    Still images yield a single frame. Animated images and videos yield
+    the first frame followed by the strongest scene changes, found by
+    differencing downscaled signatures of consecutive frames. The scan
+    for scene changes only runs once the caller asks for a second frame,
+    so a confident match on the first frame costs a single decode.
+    """
+    info = probe_media(path)
+    # Still images have nothing to compare, so skip the signature pass
+    if not info.animated:
+        yield load_still_image(info)
+        return
+    if info.video:
+        frames = iter_video_frames(info)
+    else:
+        frames = iter_image_frames(info)
+
+    first = next(frames, None)
+    if first is None:
+        err(f"Could not decode any frames from {path}")
+    yield first
+
+    prev_signature = get_signature(first)
+    # Min-heap of (score, idx, frame) holding the strongest cuts
+    cuts = []
+    for idx, frame in enumerate(frames, 1):
+        signature = get_signature(frame)
+        score = get_difference(prev_signature, signature)
+        if score >= SCENE_THRESHOLD and max_frames > 1:
+            entry = (score, idx, frame)
+            if len(cuts) < max_frames - 1:
+                heappush(cuts, entry)
+            else:
+                heappushpop(cuts, entry)
+        prev_signature = signature
+
+    cuts.sort(reverse=True)
+    verb(f"Found {len(cuts)} scene change keyframe(s) in {path}")
+    for _, _, frame in cuts:
+        yield frame
@@ -16,6 +16,7 @@ from .utils import (verb,
                     err,
                     warn)
 from .api import Api, ApiError, DBType
+from .media import sample_keyframes, MediaError, THUMBNAIL_SIZE
 from .types.saucenao import (SaucenaoResponse,
                              SaucenaoResult)
 from .types.e621 import E621Result
@@ -23,6 +24,8 @@ from .types.e621 import E621Result
 
 API_URL = "https://saucenao.com/search.php"
 SIMILARITY_THRESHOLD = 60.0
+# Stop querying further keyframes once a result is at least this similar
+CONFIDENT_SIMILARITY = 85.0
 MAX_FETCH_ATTEMPTS = 3
 
 
@@ -42,24 +45,33 @@ class SauceNaoApi(Api):
     def get_results(self):
         pass
 
-    def load_json_data(self, path: str) -> SaucenaoResponse:
-        with open(path, 'r') as f:
-            response = json.loads(
-                f.read(), object_hook=SaucenaoResponse.from_json)
-            return response
-
-    def fetch_response(self,
-                       path: str,
-                       store_json: bool = False) -> SaucenaoResponse:
-        """Handles the REST response, returns the header and results"""
+    def iter_responses(self, path: str) -> Iterator[str]:
+        """Yields raw JSON responses for `path`, one per keyframe"""
         if path.endswith('.json'):
-            return self.load_json_data(path)
-        file_ext = path.split('.')[-1]
+            # Stored responses are parsed instead of querying the API
+            with open(path, 'r') as f:
+                yield f.read()
+            return
+        # Keyframes are sampled lazily, so stopping early skips the scan
+        frames = sample_keyframes(path)
+        while True:
+            try:
+                frame = next(frames)
+            except StopIteration:
+                return
+            except Exception as e:
+                raise MediaError(str(e)) from e
+            yield self.fetch_text(path, frame)
+
+    def fetch_text(self, path: str, frame: Image.Image) -> str:
+        """Uploads a keyframe of `path`, returns the raw JSON response"""
+        file_format = get_format_type(path)
         files = {}
         # Use a thumbnail instead of base image to reduce bandwidth for very
         # large images
-        with get_thumbnail(path) as image_data:
-            files['file'] = (f'image.{file_ext}', image_data.getvalue())
+        with get_thumbnail(frame, file_format) as image_data:
+            files['file'] = (f'image.{file_format.lower()}',
+                             image_data.getvalue())
 
         for _ in range(MAX_FETCH_ATTEMPTS):
             r = requests.post(self.url, files=files)
@@ -71,13 +83,7 @@ class SauceNaoApi(Api):
                 sleep(10)
                 continue
 
-            # If `store_json` is set, save the resulting JSON for later parsing
-            if store_json:
-                with open('debug-saucenao.json', 'w') as f:
-                    f.write(r.text)
-            response = json.loads(
-                r.text, object_hook=SaucenaoResponse.from_json)
-            return response
+            return r.text
         raise Exception("Out of attempts.")
 
     def get_post_ids(self,
@@ -94,22 +100,41 @@ class SauceNaoApi(Api):
                     continue
                 print(f"Beginning parse for {path}...")
                 post_ids = []
-                response = self.fetch_response(path, args.store_json)
-
-                # Handle API stuff
-                user_id: int = response.header.user_id
-                status: int = response.header.status
-                if user_id > 0:
-                    if status > 0:
-                        warn("Index resolution error.")
-                    elif status < 0:
-                        raise ApiError("Bad image or other request error.")
-                else:
-                    raise ApiError("API did not respond. Cannot continue.")
-
-                # Handle results
-                results = list(filter(filter_func, response.results))
-                results.sort(key=sort_func)
+                # Animated images and videos are looked up one keyframe at
+                # a time, best candidate first. sample_keyframes yields at
+                # most MAX_KEYFRAMES frames, which bounds the queries per file
+                results = []
+                text = selected_text = None
+                # Unreadable media only skips this file, not the batch
+                try:
+                    for idx, text in enumerate(self.iter_responses(path)):
+                        response = parse_response(text)
+                        check_header(response)
+
+                        # Handle results
+                        frame_results = list(filter(filter_func,
+                                                    response.results))
+                        frame_results.sort(key=sort_func)
+                        if not frame_results:
+                            continue
+                        if not results or (sort_func(frame_results[0])
+                                           < sort_func(results[0])):
+                            results = frame_results
+                            selected_text = text
+                        # Skip the remaining keyframes after a confident match
+                        if float(results[0].header.similarity) \
+                                >= CONFIDENT_SIMILARITY:
+                            verb(f"Confident match on keyframe {idx}")
+                            break
+                except MediaError as e:
+                    warn(f"Could not read {path}:", str(e))
+                    if not results:
+                        continue
+                # Only keep the response the results were taken from, or the
+                # last one when no keyframe matched
+                if args.store_json and not path.endswith('.json') \
+                        and text is not None:
+                    store_response(selected_text or text)
                 if len(results) == 0:
                     warn("No close matches for", path)
                     continue
@@ -131,6 +156,30 @@ class SauceNaoApi(Api):
         return files
 
 
+def parse_response(text: str) -> SaucenaoResponse:
+    """Parses the raw JSON of a Saucenao API response"""
+    return json.loads(text, object_hook=SaucenaoResponse.from_json)
+
+
+def store_response(text: str):
+    """Saves the raw JSON of a response for later parsing"""
+    with open('debug-saucenao.json', 'w') as f:
+        f.write(text)
+
+
+def check_header(response: SaucenaoResponse):
+    """Raises ApiError if the response header reports a failure"""
+    user_id: int = response.header.user_id
+    status: int = response.header.status
+    if user_id > 0:
+        if status > 0:
+            warn("Index resolution error.")
+        elif status < 0:
+            raise ApiError("Bad image or other request error.")
+    else:
+        raise ApiError("API did not respond. Cannot continue.")
+
+
 def sort_func(result: SaucenaoResult):
     """Sort by similarity"""
     return SIMILARITY_THRESHOLD - float(result.header.similarity)
@@ -142,16 +191,11 @@ def filter_func(result: SaucenaoResult):
 
 
 @contextmanager
-def get_thumbnail(path: str) -> Iterator[BytesIO]:
+def get_thumbnail(image: Image.Image,
+                  file_format: str) -> Iterator[BytesIO]:
     """Returns a contextmanager which yields thumbnail data"""
-    file_format = get_format_type(path)
-
-    image = Image.open(path)
     image = image.convert('RGB')
-    width, height = image.size
-    aspect_ratio = width / height
-    if width > 512:
-        image.thumbnail((512, 512 * aspect_ratio))
+    image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
     image_data = BytesIO()
     image.save(image_data, format=file_format)
     try:
@@ -161,9 +205,9 @@ def get_thumbnail(path: str) -> Iterator[BytesIO]:
 
 
 def get_format_type(path) -> str:
-    """Gets the format type for a file"""
+    """Gets the upload format type for a file"""
     file_format: str = path.split('.')[-1].upper()
-    if file_format == "JPG":
-        file_format = "JPEG"
-
-    return file_format
+    if file_format in ("JPG", "JPEG"):
+        return "JPEG"
+    # Animated, modern and video formats are uploaded as a single PNG frame
+    return "PNG"
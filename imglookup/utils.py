@@ -4,6 +4,7 @@ from os.path import (normpath,
                      dirname,
                      basename,
                      isdir)
+from typing import Iterable
 
 verbose = False
 
@@ -32,13 +33,14 @@ def err(*msg, error=None):
     raise error
 
 
-def get_recursive_images(dirpath: str) -> list[str]:
-    """Return list of images within a directory"""
+def get_recursive_images(dirpath: str,
+                         exts: Iterable[str]) -> list[str]:
+    """Return list of files with one of `exts` within a directory"""
     paths = []
     for idx, (root, dirs, files) in enumerate(walk(dirpath)):
         for file in files:
             ext = file.split('.')[-1].lower()
-            if ext not in ('jpg', 'jpeg', 'png', 'gif'):
+            if ext not in exts:
                 continue
             paths.append(normpath(path_join(root, file)))
         if idx == 3: